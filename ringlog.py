@@ -0,0 +1,148 @@
+# Leveled logger that records into a preallocated in-RAM ring buffer.
+#
+# Usage: `import ringlog as log` then `log.info("Loaded %d schedules", count)`.
+# Messages are stored as (format, args) and only formatted when read via
+# records() or mirrored to the UART, so a record costs no string allocation.
+# Arguments that aren't scalars (exceptions, tuples, ...) are converted to
+# str when recorded, so no record pins objects or reads state that changed.
+# Disabled levels are rebound to a no-op by set_level(), so filtered calls
+# skip even the level comparison. Always call through the module
+# (log.debug(...)); a `from ringlog import debug` would keep the old binding.
+
+try:
+    from micropython import const
+except ImportError:
+    # Running on the host (CPython)
+    def const(value):
+        return value
+
+try:
+    from time import ticks_ms
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+# --- Log Levels ---
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# --- Ring Buffer ---
+LOG_CAPACITY = const(64)  # Number of records kept in RAM
+
+_seq = 0                           # Sequence number of the next record
+_ticks = [0] * LOG_CAPACITY        # ticks_ms() when each record was written
+_levels = bytearray(LOG_CAPACITY)  # Level of each record
+_fmts = [None] * LOG_CAPACITY      # Format string of each record (usually a constant)
+_args = [None] * LOG_CAPACITY      # Argument tuple of each record (scalars only)
+
+_level = INFO
+_mirror_level = None  # Records at or above this level are also printed to the UART
+
+def _format(fmt, args):
+    """Render a stored record's message."""
+    if not args:
+        return fmt
+    try:
+        return fmt % args
+    except (TypeError, ValueError):
+        return f"{fmt} {args}"
+
+_SCALAR_TYPES = (int, float, str, bool, type(None))
+
+def _scalars(args):
+    """Return args with every non-scalar argument replaced by its str()."""
+    for arg in args:
+        if not isinstance(arg, _SCALAR_TYPES):
+            return tuple(arg if isinstance(arg, _SCALAR_TYPES) else str(arg) for arg in args)
+    return args
+
+def _write(level, fmt, args):
+    """Store one record in the next ring buffer slot, overwriting the oldest."""
+    global _seq
+    args = _scalars(args)
+    slot = _seq % LOG_CAPACITY
+    _ticks[slot] = ticks_ms()
+    _levels[slot] = level
+    _fmts[slot] = fmt
+    _args[slot] = args
+    _seq += 1
+    if _mirror_level is not None and level >= _mirror_level:
+        print(f"[{LEVEL_NAMES[level]}] {_format(fmt, args)}")
+
+def _drop(fmt, *args):
+    """Stand-in for disabled levels."""
+    pass
+
+def _debug(fmt, *args):
+    _write(DEBUG, fmt, args)
+
+def _info(fmt, *args):
+    _write(INFO, fmt, args)
+
+def _warning(fmt, *args):
+    _write(WARNING, fmt, args)
+
+def error(fmt, *args):
+    """Log an error. Errors are always recorded."""
+    _write(ERROR, fmt, args)
+
+debug = _drop
+info = _info
+warning = _warning
+
+# --- Configuration ---
+
+def set_level(level):
+    """Set the minimum recorded level, rebinding disabled levels to a no-op."""
+    global _level, debug, info, warning
+    _level = level
+    debug = _debug if level <= DEBUG else _drop
+    info = _info if level <= INFO else _drop
+    warning = _warning if level <= WARNING else _drop
+
+def get_level():
+    """Return the minimum recorded level."""
+    return _level
+
+def set_mirror(level):
+    """Also print records at or above `level` to the UART. None disables mirroring."""
+    global _mirror_level
+    _mirror_level = level
+
+def parse_level(name):
+    """Return the level for a name like "debug", or None if unknown."""
+    name = name.upper()
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == name:
+            return level
+    return None
+
+# --- Reading ---
+
+def next_seq():
+    """Return the sequence number the next record will get."""
+    return _seq
+
+def records(since=0):
+    """Return formatted records with sequence number >= since, oldest first.
+
+    Records that were already overwritten are skipped; compare the first
+    record's "seq" with `since` to detect the gap.
+    """
+    start = max(since, _seq - LOG_CAPACITY, 0)
+    result = []
+    for seq in range(start, _seq):
+        slot = seq % LOG_CAPACITY
+        result.append({
+            "seq": seq,
+            "ticks_ms": _ticks[slot],
+            "level": LEVEL_NAMES[_levels[slot]],
+            "message": _format(_fmts[slot], _args[slot])
+        })
+    return result
@@ -0,0 +1,204 @@
+# Schedule evaluation shared by the ESP32 firmware (webserver.py) and host-side tools.
+# This module only uses builtins and ringlog so it runs unchanged on MicroPython and CPython.
+
+import ringlog as log
+
+MINUTES_PER_DAY = 1440
+
+# Channel indexes inside a compiled segment tuple (start_minute, warm, natural)
+WARM = 1
+NATURAL = 2
+
+# --- Time Parsing ---
+
+def parse_time_to_minutes(time_str):
+    """Parse a time string like "14:30" or ISO format to minutes since midnight."""
+    try:
+        # Simple HH:MM format
+        if ":" in time_str and len(time_str) <= 5:
+            hours, minutes = time_str.split(":")
+            return int(hours) * 60 + int(minutes)
+
+        # If it's a full ISO datetime string like "2023-10-27T08:00:00Z"
+        if "T" in time_str:
+            # Extract the time part after T
+            time_part = time_str.split("T")[1]
+            # Remove Z, +00:00, etc.
+            time_part = time_part.split("+")[0].split("Z")[0].split(".")[0]
+            hours, minutes, _ = time_part.split(":")
+            return int(hours) * 60 + int(minutes)
+
+        # If it's another format we don't recognize, try using timestamp
+        return 0
+    except Exception as e:
+        log.warning("Error parsing time string '%s': %s", time_str, e)
+        return 0
+
+def format_minutes(minutes):
+    """Format minutes since midnight as HH:MM."""
+    minutes %= MINUTES_PER_DAY
+    return "{:02d}:{:02d}".format(minutes // 60, minutes % 60)
+
+# --- Schedule Compilation ---
+
+def _active_intervals(start_minutes, end_minutes):
+    """Return the [start, end) minute ranges within one day where a schedule is active."""
+    if end_minutes < start_minutes:
+        # Schedule spans across midnight
+        ranges = ((start_minutes, MINUTES_PER_DAY), (0, end_minutes))
+    else:
+        ranges = ((start_minutes, end_minutes),)
+
+    intervals = []
+    for start, end in ranges:
+        # Clip to the day so odd values (e.g. "25:00") behave like the minute-by-minute check
+        start = max(0, start)
+        end = min(MINUTES_PER_DAY, end)
+        if start < end:
+            intervals.append((start, end))
+    return intervals
+
+def compile_schedules(schedules):
+    """Compile a schedule list into sorted day segments.
+
+    Each segment is a tuple (start_minute, warm_level, natural_level) that holds
+    until the next segment starts. A level of None means no schedule drives that
+    channel, so the manual setting applies.
+    """
+    events = {0: []}  # minute -> list of (channel, brightness, delta)
+
+    for schedule in schedules:
+        try:
+            start_time = schedule.get("startTime", "")
+            end_time = schedule.get("endTime", "")
+
+            # Skip schedules without proper time info
+            if not start_time or not end_time:
+                continue
+
+            light_type = schedule.get("lightType", "both")
+            # Brightness never goes below the 0% baseline and is clamped like set_led_brightness()
+            brightness = min(100, max(0, int(schedule.get("brightness", 100))))
+
+            channels = []
+            if light_type == "warm" or light_type == "both":
+                channels.append(WARM)
+            if light_type == "natural" or light_type == "both":
+                channels.append(NATURAL)
+            if not channels:
+                continue
+
+            intervals = _active_intervals(parse_time_to_minutes(start_time),
+                                          parse_time_to_minutes(end_time))
+        except Exception as e:
+            log.warning("Error processing schedule: %s", e)
+            continue
+
+        for start, end in intervals:
+            for channel in channels:
+                events.setdefault(start, []).append((channel, brightness, 1))
+                events.setdefault(end, []).append((channel, brightness, -1))
+
+    # Sweep the day, keeping a count of active schedules per brightness and channel
+    active = (None, {}, {})
+    segments = []
+    for minute in sorted(events):
+        if minute >= MINUTES_PER_DAY:
+            break
+        for channel, brightness, delta in events[minute]:
+            counts = active[channel]
+            count = counts.get(brightness, 0) + delta
+            if count:
+                counts[brightness] = count
+            else:
+                del counts[brightness]
+
+        warm = max(active[WARM]) if active[WARM] else None
+        natural = max(active[NATURAL]) if active[NATURAL] else None
+
+        # Merge with the previous segment when nothing changes
+        if segments and segments[-1][WARM] == warm and segments[-1][NATURAL] == natural:
+            continue
+        segments.append((minute, warm, natural))
+
+    return segments
+
+# --- Segment Evaluation ---
+
+def _segment_index(segments, minute):
+    """Binary search for the segment containing the given minute of the day."""
+    low = 0
+    high = len(segments) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if segments[mid][0] <= minute:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def levels_at(segments, minute):
+    """Return the scheduled (warm, natural) levels at a minute of the day, None where unscheduled."""
+    segment = segments[_segment_index(segments, minute % MINUTES_PER_DAY)]
+    return segment[WARM], segment[NATURAL]
+
+def timeline(segments, start, end, manual_warm=0, manual_natural=0):
+    """List the level transitions between two minute offsets.
+
+    Offsets count minutes from midnight of day 0, so a week is 0..10080. The
+    first entry describes the state at `start`; each further entry is a point
+    where at least one channel changes level. Unscheduled channels fall back to
+    the manual levels, exactly as check_and_apply_schedules() does.
+    """
+    transitions = []
+    if end <= start:
+        return transitions
+
+    day_start = start - start % MINUTES_PER_DAY
+    index = _segment_index(segments, start % MINUTES_PER_DAY)
+    minute = start
+    last_warm = None
+    last_natural = None
+
+    while minute < end:
+        _, warm, natural = segments[index]
+        if warm is None:
+            warm = manual_warm
+        if natural is None:
+            natural = manual_natural
+
+        if not transitions or warm != last_warm or natural != last_natural:
+            transitions.append({
+                "minute": minute,
+                "day": minute // MINUTES_PER_DAY,
+                "time": format_minutes(minute),
+                "warm": warm,
+                "natural": natural
+            })
+            last_warm = warm
+            last_natural = natural
+
+        index += 1
+        if index == len(segments):
+            # Wrap around to the first segment of the next day
+            index = 0
+            day_start += MINUTES_PER_DAY
+        minute = day_start + segments[index][0]
+
+    return transitions
+
+# --- Host-side Preview ---
+if __name__ == "__main__":
+    # Usage: python schedule_timeline.py schedules.json [from_minute] [to_minute]
+    import sys
+    import json
+
+    log.set_mirror(log.WARNING)
+
+    with open(sys.argv[1], 'r') as f:
+        preview_schedules = json.load(f)
+    range_start = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    range_end = int(sys.argv[3]) if len(sys.argv) > 3 else range_start + MINUTES_PER_DAY
+
+    for transition in timeline(compile_schedules(preview_schedules), range_start, range_end):
+        print(f"day {transition['day']} {transition['time']}  warm={transition['warm']}%  natural={transition['natural']}%")
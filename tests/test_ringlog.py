@@ -0,0 +1,95 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ringlog as log
+
+
+@pytest.fixture(autouse=True)
+def restore_config():
+    level = log.get_level()
+    log.set_mirror(None)
+    yield
+    log.set_level(level)
+    log.set_mirror(None)
+
+
+def test_wrap_around_keeps_the_newest_records():
+    log.set_level(log.INFO)
+    start = log.next_seq()
+    for i in range(log.LOG_CAPACITY + 10):
+        log.info("record %d", i)
+
+    records = log.records(start)
+    assert len(records) == log.LOG_CAPACITY
+    # The first 10 were overwritten, so reading from `start` shows a gap
+    assert records[0]["seq"] == start + 10
+    assert records[0]["message"] == "record 10"
+    assert records[-1]["seq"] == log.next_seq() - 1
+    assert records[-1]["message"] == "record %d" % (log.LOG_CAPACITY + 9)
+    assert [r["seq"] for r in records] == list(range(start + 10, log.next_seq()))
+
+
+def test_records_since_returns_only_newer_records():
+    log.set_level(log.INFO)
+    log.info("before")
+    since = log.next_seq()
+    log.info("after %s", "one")
+    log.warning("after %s", "two")
+
+    records = log.records(since)
+    assert [r["message"] for r in records] == ["after one", "after two"]
+    assert [r["level"] for r in records] == ["INFO", "WARNING"]
+    assert log.records(log.next_seq()) == []
+
+
+def test_set_level_rebinds_disabled_levels_to_no_op():
+    log.set_level(log.ERROR)
+    assert log.debug is log._drop
+    assert log.info is log._drop
+    assert log.warning is log._drop
+
+    since = log.next_seq()
+    log.debug("hidden")
+    log.info("hidden")
+    log.warning("hidden")
+    log.error("shown %d", 1)
+    assert [r["message"] for r in log.records(since)] == ["shown 1"]
+
+    log.set_level(log.DEBUG)
+    assert log.debug is not log._drop
+    since = log.next_seq()
+    log.debug("visible")
+    assert [r["level"] for r in log.records(since)] == ["DEBUG"]
+
+
+def test_non_scalar_arguments_are_stored_as_str():
+    log.set_level(log.INFO)
+    since = log.next_seq()
+    config = ["192.168.1.2"]
+    try:
+        raise OSError(113, "EHOSTUNREACH")
+    except OSError as e:
+        log.error("failed %s for %s", e, config)
+    config.append("changed later")
+
+    slot = since % log.LOG_CAPACITY
+    assert all(isinstance(arg, str) for arg in log._args[slot])
+    assert log.records(since)[0]["message"] == "failed [Errno 113] EHOSTUNREACH for ['192.168.1.2']"
+
+
+def test_scalar_arguments_are_kept_as_is():
+    since = log.next_seq()
+    log.error("values %d %s %s", 5, None, True)
+    assert log._args[since % log.LOG_CAPACITY] == (5, None, True)
+
+
+def test_mismatched_format_falls_back_to_raw_arguments():
+    since = log.next_seq()
+    log.error("two values %d %d", 1)
+    log.error("not a number %d", "x")
+    messages = [r["message"] for r in log.records(since)]
+    assert messages == ["two values %d %d (1,)", "not a number %d ('x',)"]
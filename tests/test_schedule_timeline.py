@@ -0,0 +1,104 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_timeline import MINUTES_PER_DAY, compile_schedules, levels_at, parse_time_to_minutes, timeline
+
+
+def minute_by_minute(schedules, current_minutes):
+    """The per-minute rule check_and_apply_schedules() used before schedules were compiled."""
+    warm_active = natural_active = False
+    warm_brightness = natural_brightness = 0
+    for schedule in schedules:
+        try:
+            start_time = schedule.get("startTime", "")
+            end_time = schedule.get("endTime", "")
+            if not start_time or not end_time:
+                continue
+            start_minutes = parse_time_to_minutes(start_time)
+            end_minutes = parse_time_to_minutes(end_time)
+            if end_minutes < start_minutes:
+                active = current_minutes >= start_minutes or current_minutes < end_minutes
+            else:
+                active = start_minutes <= current_minutes < end_minutes
+            if active:
+                light_type = schedule.get("lightType", "both")
+                brightness = int(schedule.get("brightness", 100))
+                if light_type == "warm" or light_type == "both":
+                    warm_active = True
+                    warm_brightness = max(warm_brightness, brightness)
+                if light_type == "natural" or light_type == "both":
+                    natural_active = True
+                    natural_brightness = max(natural_brightness, brightness)
+        except Exception:
+            continue
+    # set_led_brightness() clamps to 0-100 when the level is applied
+    return (min(100, warm_brightness) if warm_active else None,
+            min(100, natural_brightness) if natural_active else None)
+
+
+def assert_matches(schedules):
+    segments = compile_schedules(schedules)
+    for minute in range(MINUTES_PER_DAY):
+        assert levels_at(segments, minute) == minute_by_minute(schedules, minute), minute
+
+
+def test_midnight_wrap():
+    schedules = [{"startTime": "22:00", "endTime": "06:30", "lightType": "warm", "brightness": 40}]
+    assert_matches(schedules)
+    segments = compile_schedules(schedules)
+    assert levels_at(segments, 23 * 60) == (40, None)
+    assert levels_at(segments, 6 * 60 + 29) == (40, None)
+    assert levels_at(segments, 6 * 60 + 30) == (None, None)
+
+
+def test_start_equal_to_end_is_never_active():
+    schedules = [{"startTime": "08:00", "endTime": "08:00", "lightType": "both", "brightness": 70}]
+    assert_matches(schedules)
+    assert compile_schedules(schedules) == [(0, None, None)]
+
+
+def test_brightness_is_clamped():
+    schedules = [
+        {"startTime": "07:00", "endTime": "09:00", "lightType": "natural", "brightness": 150},
+        {"startTime": "10:00", "endTime": "11:00", "lightType": "warm", "brightness": -20},
+    ]
+    assert_matches(schedules)
+    segments = compile_schedules(schedules)
+    assert levels_at(segments, 8 * 60) == (None, 100)
+    assert levels_at(segments, 10 * 60) == (0, None)
+
+
+def test_overlapping_schedules_take_the_maximum():
+    schedules = [
+        {"startTime": "06:00", "endTime": "12:00", "lightType": "both", "brightness": 30},
+        {"startTime": "09:00", "endTime": "10:00", "lightType": "warm", "brightness": 80},
+        {"startTime": "T", "endTime": "10:00"},
+        {"startTime": "09:00", "endTime": "10:00", "lightType": "unknown"},
+        {"startTime": "", "endTime": "10:00"},
+    ]
+    assert_matches(schedules)
+
+
+def test_random_schedules_match_minute_by_minute():
+    rng = random.Random(1)
+    for _ in range(200):
+        schedules = [{
+            "startTime": f"{rng.randint(-1, 25)}:{rng.randint(0, 59):02d}",
+            "endTime": f"{rng.randint(0, 24)}:{rng.randint(0, 59):02d}",
+            "lightType": rng.choice(["warm", "natural", "both", "other"]),
+            "brightness": rng.randint(-10, 120),
+        } for _ in range(rng.randint(0, 8))]
+        assert_matches(schedules)
+
+
+def test_timeline_lists_level_changes_across_days():
+    schedules = [{"startTime": "22:00", "endTime": "06:00", "lightType": "both", "brightness": 50}]
+    transitions = timeline(compile_schedules(schedules), 12 * 60, MINUTES_PER_DAY + 12 * 60, 5, 10)
+    assert [(t["minute"], t["warm"], t["natural"]) for t in transitions] == [
+        (12 * 60, 5, 10),
+        (22 * 60, 50, 50),
+        (MINUTES_PER_DAY + 6 * 60, 5, 10),
+    ]
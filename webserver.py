@@ -3,16 +3,25 @@ import socket
 import machine
 import time
 import gc # Garbage collection
+import os # For atomic file replacement
 import ujson # Import ujson for JSON parsing
 import ntptime # For time synchronization
 import utime
 import urequests
 import ubinascii
+import ringlog as log # Ring-buffer logger (replaces print() on hot paths)
+from schedule_timeline import MINUTES_PER_DAY, compile_schedules, levels_at, timeline
 
 # --- Wi-Fi Configuration ---
 WIFI_CONFIG_FILE = "wifi_config.json"  # File to store WiFi credentials
 WIFI_SSID = ""          
 WIFI_PASSWORD = "" 
+WIFI_CONNECT_TIMEOUT = 20  # Seconds to wait for a station connection
+WIFI_ROLLBACK_TIMEOUT = 10  # Seconds to wait when reconnecting to the previous network after a failed switch
+WIFI_DISCONNECT_TIMEOUT = 5  # Seconds to wait for the station link to drop
+# Longest the device can be off the network while switching credentials
+WIFI_SWITCH_MAX_DOWNTIME = 2 * WIFI_DISCONNECT_TIMEOUT + WIFI_CONNECT_TIMEOUT + WIFI_ROLLBACK_TIMEOUT
+pending_wifi_config = None  # (ssid, password) queued by POST /wifi/config, applied by the main loop
 
 # --- LED Configuration ---
 WARM_LED_PIN = 18
@@ -25,34 +34,133 @@ PWM_MAX_DUTY = 1023 # For ESP32's 10-bit PWM resolution
 # --- Schedule Configuration ---
 SCHEDULE_FILE = "schedules.json"  # File to store schedules
 CHECK_SCHEDULE_INTERVAL = 10      # Check schedules every 10 seconds (more frequent checks)
-TIME_SYNC_INTERVAL = 3600         # Sync time every hour (3600 seconds)
+TIME_SYNC_INTERVAL = 3600         # Initial sync interval; adapts between the limits below
+TIME_SYNC_MIN_INTERVAL = 900      # Shortest sync interval, used while the clock is unsettled
+TIME_SYNC_MAX_INTERVAL = 86400    # Longest sync interval once drift is stable
+TIME_SYNC_RETRY_INTERVAL = 30     # First retry after a failed sync; doubles up to TIME_SYNC_MIN_INTERVAL
+CLOCK_STEP_THRESHOLD = 2          # Clock errors above this (seconds) are stepped; smaller ones are slewed
+CLOCK_STABLE_THRESHOLD = 1        # Clock errors up to this (seconds) widen the sync interval; NTP and RTC only give whole seconds
+CLOCK_SLEW_RATE = 0.005           # Largest correction slewed in per second (5 ms/s)
+DRIFT_HISTORY_SIZE = 8            # NTP offset samples kept for the drift estimate
+FIREBASE_UPDATE_INTERVAL = 3600   # Refresh the Firebase registration every hour
+FIREBASE_RETRY_INTERVAL = 30      # First retry after a failed registration; doubles up to FIREBASE_UPDATE_INTERVAL
+MAX_TIMELINE_MINUTES = 31 * MINUTES_PER_DAY  # Longest range /schedules/timeline will evaluate
+
+# --- Server Admission Configuration ---
+LISTEN_BACKLOG = 2               # Connections queued behind the one being served; the stack refuses the rest
+READ_TIMEOUT_MS = 1000           # Longest a single recv()/send() may block
+CONNECTION_DEADLINE_MS = 3000    # Longest time to receive a complete request
+MAX_REQUEST_BYTES = 4096         # Largest request (headers + body) accepted
+CLIENT_RATE = 5                  # Requests per second allowed per client IP (token refill rate)
+CLIENT_BURST = 10                # Requests a client IP may make back-to-back
+CLIENT_FREE_HOLD_MS = 200        # Time a connection may hold the loop for its single token
+CLIENT_HOLD_MS_PER_TOKEN = 20    # Each further 20 ms of holding the loop costs the client one more token
+REJECT_DRAIN_MS = 10             # Grace for reading a rejected request so the error isn't lost to a TCP RST
+MAX_TRACKED_CLIENTS = 16         # Client IPs remembered for rate limiting
+GLOBAL_RATE = 20                 # Requests per second served across all clients
+GLOBAL_BURST = 30                # Requests served back-to-back across all clients
+
+# --- Response Streaming Configuration ---
+CHUNK_BUFFER_SIZE = 512      # Bytes collected per chunk when streaming large responses
+RESPONSE_DEADLINE_MS = 3000  # Time a streamed response may take in total before it is aborted
+
+# --- Logging Configuration ---
+LOG_LEVEL = log.INFO          # Minimum level kept in the RAM log (log.DEBUG while developing)
+LOG_UART_LEVEL = log.WARNING  # Also print records at or above this level to the UART (None = off)
+log.set_level(LOG_LEVEL)
+log.set_mirror(LOG_UART_LEVEL)
+
+# --- Boot Configuration ---
+FAST_BOOT = True  # Restore the last LED levels and serve HTTP before Firebase/NTP work
+OUTPUT_STATE_FILE = "output_state.json"  # Snapshot of the last applied LED levels
+OUTPUT_STATE_TMP_FILE = OUTPUT_STATE_FILE + ".tmp"  # Written first, then renamed over the snapshot
+OUTPUT_STATE_SAVE_DELAY = 5  # Seconds to batch level changes before rewriting the snapshot (limits flash wear)
+boot_metrics = {}  # Boot milestone -> time.ticks_ms() since power-on
+
+def record_boot_metric(name):
+    """Record the first time a boot milestone is reached."""
+    if name not in boot_metrics:
+        boot_metrics[name] = time.ticks_ms()
+        log.info("Boot metric %s: %d ms", name, boot_metrics[name])
+
+# --- Output State Snapshot ---
+
+def brightness_to_duty(level):
+    """Converts a 0-100 brightness level to a duty cycle for COMMON ANODE configuration."""
+    # For COMMON ANODE, 0% brightness is MAX_DUTY, 100% brightness is 0 duty.
+    # Invert the level: 0% brightness -> 100% inverted level
+    #                 100% brightness -> 0% inverted level
+    inverted_level = 100 - level
+    return int(inverted_level / 100 * PWM_MAX_DUTY)
+
+def read_output_state(path):
+    """Read one output state snapshot file, clamping every level."""
+    with open(path, 'r') as f:
+        state = ujson.load(f)
+    # Clamp everything so a corrupted snapshot can't produce an invalid duty
+    for key in ("warm", "natural", "manual_warm", "manual_natural"):
+        state[key] = max(0, min(100, int(state.get(key, 0))))
+    return state
+
+def load_output_state():
+    """Load the last applied LED levels from flash."""
+    # The temp file only survives if power was lost between the write and the rename
+    for path in (OUTPUT_STATE_FILE, OUTPUT_STATE_TMP_FILE):
+        try:
+            state = read_output_state(path)
+            log.info("Loaded output state from %s", path)
+            return state
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # File might not exist yet, which is fine
+            if "ENOENT" not in str(e):
+                log.error("Error loading output state from %s: %s", path, e)
+    return {}
+
+output_state = load_output_state() if FAST_BOOT else {}
 
 # --- Initialize LEDs ---
 try:
-    warm_led_pwm = machine.PWM(machine.Pin(WARM_LED_PIN), freq=PWM_FREQ)
-    natural_led_pwm = machine.PWM(machine.Pin(NATURAL_LED_PIN), freq=PWM_FREQ)
-    print(f"Initialized PWM for Warm LED (GPIO {WARM_LED_PIN}) and Natural LED (GPIO {NATURAL_LED_PIN}).")
-    
-    # Initialize LEDs to OFF (100% duty for common anode = off)
-    warm_led_pwm.duty(PWM_MAX_DUTY)
-    natural_led_pwm.duty(PWM_MAX_DUTY)
+    # Start at the restored level (OFF without a snapshot) so the lights don't drop out on reboot
+    warm_led_pwm = machine.PWM(machine.Pin(WARM_LED_PIN), freq=PWM_FREQ, duty=brightness_to_duty(output_state.get("warm", 0)))
+    natural_led_pwm = machine.PWM(machine.Pin(NATURAL_LED_PIN), freq=PWM_FREQ, duty=brightness_to_duty(output_state.get("natural", 0)))
+    log.info("Initialized PWM for Warm LED (GPIO %d) and Natural LED (GPIO %d).", WARM_LED_PIN, NATURAL_LED_PIN)
+    record_boot_metric("light")
 except ValueError as e:
-    print(f"Error initializing PWM: {e}. Check if the pins are valid PWM pins.")
+    log.error("Error initializing PWM: %s. Check if the pins are valid PWM pins.", e)
     warm_led_pwm = None
     natural_led_pwm = None
 
 # --- Time Tracking Variables ---
 last_schedule_check = 0
-last_time_sync = 0
+next_time_sync = 0  # time.time() at which sync_time() is next due
 last_firebase_update = 0  # Add this new variable to track Firebase registration time
+firebase_registration_due = True  # Register as soon as possible after boot, whatever the RTC says
+next_firebase_attempt = 0  # time.time() before which no registration is attempted (retry backoff)
+firebase_retry = FIREBASE_RETRY_INTERVAL  # Current retry delay after failed registrations
 time_synced = False
+time_sync_interval = TIME_SYNC_INTERVAL  # Current adaptive sync interval
+time_sync_retry = TIME_SYNC_RETRY_INTERVAL  # Current retry delay after failed syncs
+
+# --- Clock Correction Variables ---
+offset_history = []  # (rtc_seconds, ntp_seconds - rtc_seconds) samples since the last clock step
+clock_fit = (0, 0.0, 0.0, 0.0)  # (rtc_ref, mean_x, offset_at_mean, drift) fitted to offset_history
+clock_correction = 0.0  # Seconds currently added to the RTC by local_time() (small, so a float is fine)
+clock_correction_at = 0  # RTC seconds when clock_correction was last advanced
 
 # --- Schedules Store ---
 current_schedules = [] # Global list to store schedules
+schedule_segments = compile_schedules(current_schedules) # Compiled day segments for current_schedules
 
 # --- Manual Control State Variables ---
-last_manual_warm_brightness = 0  # Store last manual setting for warm LED
-last_manual_natural_brightness = 0  # Store last manual setting for natural LED
+last_manual_warm_brightness = output_state.get("manual_warm", 0)  # Store last manual setting for warm LED
+last_manual_natural_brightness = output_state.get("manual_natural", 0)  # Store last manual setting for natural LED
+
+# --- Output State Variables ---
+applied_warm_brightness = output_state.get("warm", 0)  # Level the warm LED is currently driven at
+applied_natural_brightness = output_state.get("natural", 0)  # Level the natural LED is currently driven at
+saved_output_state = (applied_warm_brightness, applied_natural_brightness,
+                      last_manual_warm_brightness, last_manual_natural_brightness)
+output_state_changed_at = None  # time.time() of the first unsaved change
 
 # --- LED Control Functions ---
 
@@ -61,7 +169,7 @@ def set_led_brightness(led_pwm, level, is_from_schedule=False):
     global last_manual_warm_brightness, last_manual_natural_brightness
     
     if led_pwm is None:
-        print("LED PWM not initialized.")
+        log.warning("LED PWM not initialized.")
         return False
     try:
         # Ensure level is within 0-100 range
@@ -71,21 +179,18 @@ def set_led_brightness(led_pwm, level, is_from_schedule=False):
         if not is_from_schedule:
             if led_pwm == warm_led_pwm:
                 last_manual_warm_brightness = level
-                print(f"Stored manual warm brightness: {level}%")
+                log.debug("Stored manual warm brightness: %d%%", level)
             elif led_pwm == natural_led_pwm:
                 last_manual_natural_brightness = level
-                print(f"Stored manual natural brightness: {level}%")
+                log.debug("Stored manual natural brightness: %d%%", level)
         
-        # For COMMON ANODE, 0% brightness is MAX_DUTY, 100% brightness is 0 duty.
-        # Invert the level: 0% brightness -> 100% inverted level
-        #                 100% brightness -> 0% inverted level
-        inverted_level = 100 - level
-        duty = int(inverted_level / 100 * PWM_MAX_DUTY)
+        duty = brightness_to_duty(level)
         led_pwm.duty(duty)
-        print(f"Set brightness to {level}% (Common Anode duty={duty}).")
+        note_applied_level(led_pwm, level)
+        log.debug("Set brightness to %d%% (Common Anode duty=%d).", level, duty)
         return True
     except (ValueError, TypeError):
-        print(f"Invalid brightness level: {level}")
+        log.warning("Invalid brightness level: %s", level)
         return False
 
 def turn_led_on(led_pwm, is_from_schedule=False):
@@ -93,21 +198,22 @@ def turn_led_on(led_pwm, is_from_schedule=False):
     global last_manual_warm_brightness, last_manual_natural_brightness
     
     if led_pwm is None:
-        print("LED PWM not initialized.")
+        log.warning("LED PWM not initialized.")
         return False
     
     # Store manual setting for this LED if it's not from a schedule
     if not is_from_schedule:
         if led_pwm == warm_led_pwm:
             last_manual_warm_brightness = 100
-            print("Stored manual warm brightness: 100%")
+            log.debug("Stored manual warm brightness: 100%")
         elif led_pwm == natural_led_pwm:
             last_manual_natural_brightness = 100
-            print("Stored manual natural brightness: 100%")
+            log.debug("Stored manual natural brightness: 100%")
     
     # For COMMON ANODE, 100% brightness means 0V output, so duty cycle of 0.
     led_pwm.duty(0)
-    print("Turned LED ON (100% - Common Anode).")
+    note_applied_level(led_pwm, 100)
+    log.debug("Turned LED ON (100% - Common Anode).")
     return True
 
 def turn_led_off(led_pwm, is_from_schedule=False):
@@ -115,47 +221,182 @@ def turn_led_off(led_pwm, is_from_schedule=False):
     global last_manual_warm_brightness, last_manual_natural_brightness
     
     if led_pwm is None:
-        print("LED PWM not initialized.")
+        log.warning("LED PWM not initialized.")
         return False
     
     # Store manual setting for this LED if it's not from a schedule
     if not is_from_schedule:
         if led_pwm == warm_led_pwm:
             last_manual_warm_brightness = 0
-            print("Stored manual warm brightness: 0%")
+            log.debug("Stored manual warm brightness: 0%")
         elif led_pwm == natural_led_pwm:
             last_manual_natural_brightness = 0
-            print("Stored manual natural brightness: 0%")
+            log.debug("Stored manual natural brightness: 0%")
     
     # For COMMON ANODE, 0% brightness means 3.3V output, so duty cycle of PWM_MAX_DUTY.
     led_pwm.duty(PWM_MAX_DUTY)
-    print("Turned LED OFF (0% - Common Anode).")
+    note_applied_level(led_pwm, 0)
+    log.debug("Turned LED OFF (0% - Common Anode).")
     return True
 
+def note_applied_level(led_pwm, level):
+    """Remember the level an LED is driven at so it can be restored on the next boot."""
+    global applied_warm_brightness, applied_natural_brightness
+    if led_pwm == warm_led_pwm:
+        applied_warm_brightness = level
+    elif led_pwm == natural_led_pwm:
+        applied_natural_brightness = level
+
+def save_output_state_if_changed():
+    """Write the output state snapshot once levels have changed and OUTPUT_STATE_SAVE_DELAY has passed."""
+    global saved_output_state, output_state_changed_at
+    state = (applied_warm_brightness, applied_natural_brightness,
+             last_manual_warm_brightness, last_manual_natural_brightness)
+    if state == saved_output_state:
+        output_state_changed_at = None
+        return
+    
+    now = time.time()
+    if output_state_changed_at is None:
+        output_state_changed_at = now
+    if (now - output_state_changed_at) < OUTPUT_STATE_SAVE_DELAY:
+        return
+    
+    try:
+        # Write a temp file and rename it over the snapshot, so a power cut mid-write never corrupts it
+        with open(OUTPUT_STATE_TMP_FILE, 'w') as f:
+            ujson.dump({
+                "warm": state[0],
+                "natural": state[1],
+                "manual_warm": state[2],
+                "manual_natural": state[3]
+            }, f)
+        try:
+            os.rename(OUTPUT_STATE_TMP_FILE, OUTPUT_STATE_FILE)
+        except OSError:
+            # FAT can't rename over an existing file; load_output_state() falls back to the temp file
+            os.remove(OUTPUT_STATE_FILE)
+            os.rename(OUTPUT_STATE_TMP_FILE, OUTPUT_STATE_FILE)
+        saved_output_state = state
+        output_state_changed_at = None
+        log.debug("Saved output state to %s", OUTPUT_STATE_FILE)
+    except OSError as e:
+        log.error("Error saving output state to file: %s", e)
+        output_state_changed_at = now # Retry after another delay
+
 # --- Wi-Fi Connection Function ---
 
-def connect_wifi(ssid, password):
+def connect_wifi(ssid, password, timeout=WIFI_CONNECT_TIMEOUT):
     """Connects the ESP32 to the specified Wi-Fi network."""
     sta_if = network.WLAN(network.STA_IF)
     if not sta_if.isconnected():
-        print(f'Connecting to Wi-Fi network: {ssid}...')
+        log.info("Connecting to Wi-Fi network: %s...", ssid)
         sta_if.active(True)
         sta_if.connect(ssid, password)
-        timeout = 20 # seconds - Increased timeout slightly
         start_time = time.time()
         while not sta_if.isconnected() and (time.time() - start_time) < timeout:
             time.sleep(1) # Increased sleep slightly
-            print('.', end='')
-        print()
     if sta_if.isconnected():
-        print('Wi-Fi connected!')
         net_config = sta_if.ifconfig()
-        print('Network config:', net_config)
+        # WARNING so it reaches the serial console by default; it's how users find the device's IP
+        log.warning("Wi-Fi connected! Network config: %s", net_config)
         return net_config[0] # Return the IP address
     else:
-        print('Wi-Fi connection failed!')
+        log.warning("Wi-Fi connection failed!")
         return None
 
+def disconnect_wifi(sta_if):
+    """Drops the station link and waits until it is really down. Returns True once disconnected."""
+    sta_if.disconnect()
+    # disconnect() returns before the event is processed, so isconnected() can still be True for a while
+    start_time = time.time()
+    while sta_if.isconnected() and (time.time() - start_time) < WIFI_DISCONNECT_TIMEOUT:
+        time.sleep(0.1)
+    return not sta_if.isconnected()
+
+def start_access_point():
+    """Starts the setup Access Point and returns its IP address."""
+    ap = network.WLAN(network.AP_IF)
+    ap.active(True)
+    
+    # Generate a unique AP name using the device ID
+    device_id = get_device_id()
+    ap_ssid = f"ESP32-Setup-{device_id[-4:]}"  # Use last 4 chars of device ID
+    ap_password = "12345678"  # Simple password for setup
+    
+    ap.config(essid=ap_ssid, password=ap_password)
+    while not ap.active():
+        time.sleep(0.1)
+    
+    log.warning("Access Point started: SSID: %s, Password: %s, IP: %s", ap_ssid, ap_password, ap.ifconfig()[0])
+    return ap.ifconfig()[0]
+
+def apply_wifi_config(ssid, password):
+    """Switch to new Wi-Fi credentials in place, rolling back if they fail.
+    
+    The LED PWM outputs are never touched. A running setup Access Point stays
+    up while the new credentials are tried, and is only shut down once the
+    station link works. The credentials are saved only on success.
+    Returns the IP address the HTTP server should listen on.
+    """
+    sta_if = network.WLAN(network.STA_IF)
+    ap_if = network.WLAN(network.AP_IF)
+    old_ssid, old_password = WIFI_SSID, WIFI_PASSWORD
+    was_connected = sta_if.isconnected()
+    
+    # The station interface can only hold one link, so drop the current one to try the new network.
+    # connect_wifi() does nothing while still connected, so the old link must be fully down first.
+    if was_connected and not disconnect_wifi(sta_if):
+        log.warning("Could not drop the current Wi-Fi link. Keeping it.")
+        return sta_if.ifconfig()[0]
+    
+    new_ip = connect_wifi(ssid, password)
+    if new_ip:
+        save_wifi_config(ssid, password)
+        if ap_if.active():
+            ap_if.active(False) # Setup AP no longer needed
+            log.info("Access Point stopped.")
+        return new_ip
+    
+    # Roll back to the previous link
+    log.warning("New Wi-Fi credentials for %s failed. Rolling back.", ssid)
+    disconnect_wifi(sta_if) # Stop the failed attempt
+    if was_connected:
+        old_ip = connect_wifi(old_ssid, old_password, WIFI_ROLLBACK_TIMEOUT)
+        if old_ip:
+            return old_ip
+    
+    # No station link either way: keep serving on the setup Access Point
+    if ap_if.active():
+        return ap_if.ifconfig()[0]
+    return start_access_point()
+
+def apply_pending_wifi_config(server_socket):
+    """Applies credentials queued by POST /wifi/config and rebinds the server if the IP changed.
+    
+    Returns the server socket to keep accepting on (None if rebinding failed).
+    """
+    global pending_wifi_config, esp32_ip, firebase_registration_due, next_firebase_attempt, firebase_retry
+    ssid, password = pending_wifi_config
+    pending_wifi_config = None
+    
+    new_ip = apply_wifi_config(ssid, password)
+    if new_ip == esp32_ip and server_socket is not None:
+        return server_socket
+    
+    # The old socket is bound to the previous address
+    if server_socket is not None:
+        server_socket.close()
+    esp32_ip = new_ip
+    server_socket = start_server(esp32_ip)
+    
+    # Let the app find the device at its new address: the main loop registers
+    # right away and keeps retrying with backoff if the new network isn't ready yet
+    firebase_registration_due = True
+    next_firebase_attempt = 0
+    firebase_retry = FIREBASE_RETRY_INTERVAL
+    return server_socket
+
 # --- Schedule Persistence Functions ---
 
 def save_schedules_to_file():
@@ -164,34 +405,90 @@ def save_schedules_to_file():
     try:
         with open(SCHEDULE_FILE, 'w') as f:
             ujson.dump(current_schedules, f)
-        print(f"Saved {len(current_schedules)} schedules to {SCHEDULE_FILE}")
+        log.info("Saved %d schedules to %s", len(current_schedules), SCHEDULE_FILE)
         return True
     except OSError as e:
-        print(f"Error saving schedules to file: {e}")
+        log.error("Error saving schedules to file: %s", e)
         return False
 
 def load_schedules_from_file():
     """Load schedules from a file in flash memory."""
-    global current_schedules
+    global current_schedules, schedule_segments
     try:
         with open(SCHEDULE_FILE, 'r') as f:
             current_schedules = ujson.load(f)
-        print(f"Loaded {len(current_schedules)} schedules from {SCHEDULE_FILE}")
+        schedule_segments = compile_schedules(current_schedules)
+        log.info("Loaded %d schedules from %s", len(current_schedules), SCHEDULE_FILE)
         return True
     except OSError as e:
         # File might not exist yet, which is fine
         if "ENOENT" in str(e):
-            print(f"No schedule file found at {SCHEDULE_FILE}. Starting with empty schedules.")
+            log.info("No schedule file found at %s. Starting with empty schedules.", SCHEDULE_FILE)
         else:
-            print(f"Error loading schedules from file: {e}")
+            log.error("Error loading schedules from file: %s", e)
         current_schedules = []
+        schedule_segments = compile_schedules(current_schedules)
         return False
 
 # --- Time Synchronization ---
 
+def set_rtc(seconds):
+    """Step the RTC to the given UTC time in seconds."""
+    t = utime.gmtime(seconds)
+    machine.RTC().datetime((t[0], t[1], t[2], t[6] + 1, t[3], t[4], t[5], 0))
+
+def fit_clock_drift():
+    """Least-squares fit of the NTP offset history to an offset and a drift rate.
+    
+    MicroPython floats are single precision on the ESP32 and can't hold an
+    epoch time to the second, so the fit keeps rtc_ref as an integer and
+    only does float maths on times relative to it.
+    """
+    global clock_fit
+    n = len(offset_history)
+    if n == 0:
+        clock_fit = (time.time(), 0.0, 0.0, 0.0)
+        return
+    
+    rtc_ref = offset_history[0][0]
+    mean_x = sum(sample[0] - rtc_ref for sample in offset_history) / n
+    mean_y = sum(sample[1] for sample in offset_history) / n
+    sxx = 0.0
+    sxy = 0.0
+    for rtc_seconds, offset in offset_history:
+        dx = rtc_seconds - rtc_ref - mean_x
+        sxx += dx * dx
+        sxy += dx * (offset - mean_y)
+    drift = sxy / sxx if sxx else 0.0
+    clock_fit = (rtc_ref, mean_x, mean_y, drift)
+
+def clock_offset_error(rtc_now):
+    """Return how far the fitted offset at rtc_now is from the applied correction, in seconds."""
+    rtc_ref, mean_x, offset_at_mean, drift = clock_fit
+    # Integer subtraction first, so no epoch-sized value ever becomes a float
+    return offset_at_mean + drift * ((rtc_now - rtc_ref) - mean_x) - clock_correction
+
+def local_time():
+    """Return the drift-corrected current time in whole seconds.
+    
+    The RTC is only stepped for large errors. Between syncs the fitted drift
+    is applied here, and changes in the correction are slewed in at no more
+    than CLOCK_SLEW_RATE so schedule minutes are never skipped or repeated.
+    The result stays an integer: only the small correction is a float.
+    """
+    global clock_correction, clock_correction_at
+    rtc_now = time.time()
+    elapsed = rtc_now - clock_correction_at
+    if elapsed > 0:
+        error = clock_offset_error(rtc_now)
+        max_step = elapsed * CLOCK_SLEW_RATE
+        clock_correction += max(-max_step, min(max_step, error))
+        clock_correction_at = rtc_now
+    return rtc_now + round(clock_correction)
+
 def sync_time():
-    """Synchronize the ESP32's RTC with an NTP server."""
-    global time_synced
+    """Synchronize the local clock with an NTP server and schedule the next sync."""
+    global time_synced, next_time_sync, time_sync_interval, time_sync_retry, offset_history, clock_correction, clock_correction_at
     
     # List of NTP servers to try in order
     ntp_servers = [
@@ -205,23 +502,56 @@ def sync_time():
     # Try each server until one works
     for server in ntp_servers:
         try:
-            print(f"Trying to sync time with NTP server: {server}")
+            log.debug("Trying to sync time with NTP server: %s", server)
             ntptime.host = server
-            ntptime.settime()
-            time_synced = True
-            print(f"Time synchronized with NTP server {server}. Current time: {format_time()}")
-            return True
+            ntp_now = ntptime.time()
+            break
         except OSError as e:
-            print(f"Failed to sync time with {server}: {e}")
+            log.warning("Failed to sync time with %s: %s", server, e)
             # Continue to next server
+    else:
+        log.warning("All NTP servers failed. Will retry in %d s.", time_sync_retry)
+        next_time_sync = time.time() + time_sync_retry
+        time_sync_retry = min(TIME_SYNC_MIN_INTERVAL, time_sync_retry * 2)
+        return False
     
-    print("All NTP servers failed. Will retry later.")
-    return False
+    rtc_now = time.time()
+    local_time() # Bring the slewed correction up to date
+    # Integer offset first, then the small float correction, so the error keeps its fraction
+    error = (ntp_now - rtc_now) - clock_correction
+    
+    if not time_synced or abs(error) > CLOCK_STEP_THRESHOLD:
+        # Too far off to slew: step the RTC and start a fresh drift history
+        set_rtc(ntp_now)
+        rtc_now = time.time()
+        offset_history = [(rtc_now, 0)]
+        clock_correction = 0.0
+        clock_correction_at = rtc_now
+        time_sync_interval = TIME_SYNC_MIN_INTERVAL
+        log.info("Clock stepped by %s s using NTP server %s.", error, server)
+    else:
+        offset_history.append((rtc_now, ntp_now - rtc_now))
+        if len(offset_history) > DRIFT_HISTORY_SIZE:
+            offset_history.pop(0)
+        
+        # Widen the interval while the corrected clock keeps up, narrow it when it doesn't
+        if abs(error) <= CLOCK_STABLE_THRESHOLD:
+            time_sync_interval = min(TIME_SYNC_MAX_INTERVAL, time_sync_interval * 2)
+        else:
+            time_sync_interval = max(TIME_SYNC_MIN_INTERVAL, time_sync_interval // 2)
+        log.info("Clock error %s s using NTP server %s; slewing.", error, server)
+    
+    fit_clock_drift()
+    time_synced = True
+    time_sync_retry = TIME_SYNC_RETRY_INTERVAL
+    next_time_sync = rtc_now + time_sync_interval
+    record_boot_metric("time_synced")
+    return True
 
 def format_time(timestamp=None):
     """Format the current time or given timestamp as a readable string."""
     if timestamp is None:
-        t = time.localtime()
+        t = time.localtime(local_time())
     else:
         t = time.localtime(timestamp)
     return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
@@ -230,123 +560,82 @@ def format_time(timestamp=None):
 
 def get_minutes_since_midnight():
     """Get the current time as minutes since midnight."""
-    t = time.localtime()
+    t = time.localtime(local_time())
     return t[3] * 60 + t[4]  # hours * 60 + minutes
 
 # --- Schedule Execution ---
 
-def parse_time_to_minutes(time_str):
-    """Parse a time string like "14:30" or ISO format to minutes since midnight."""
-    try:
-        # Simple HH:MM format
-        if ":" in time_str and len(time_str) <= 5:
-            hours, minutes = time_str.split(":")
-            return int(hours) * 60 + int(minutes)
-        
-        # If it's a full ISO datetime string like "2023-10-27T08:00:00Z"
-        if "T" in time_str:
-            # Extract the time part after T
-            time_part = time_str.split("T")[1]
-            # Remove Z, +00:00, etc.
-            time_part = time_part.split("+")[0].split("Z")[0].split(".")[0]
-            hours, minutes, _ = time_part.split(":")
-            return int(hours) * 60 + int(minutes)
-            
-        # If it's another format we don't recognize, try using timestamp
-        return 0
-    except Exception as e:
-        print(f"Error parsing time string '{time_str}': {e}")
-        return 0
-
 def check_and_apply_schedules():
     """Check current schedules against the current time and apply them."""
-    global current_schedules
-    
     if not time_synced:
-        print("Time not synced yet. Cannot check schedules.")
+        log.debug("Time not synced yet. Cannot check schedules.")
         return
     
-    print(f"Checking schedules at {format_time()}...")
-    
     # Get current time in minutes since midnight
     current_minutes = get_minutes_since_midnight()
-    print(f"Current time is {current_minutes // 60}:{current_minutes % 60:02d} ({current_minutes} minutes since midnight)")
+    log.debug("Checking schedules at minute %d of the day", current_minutes)
     
-    # Track which LED types should be active based on schedules
-    warm_schedule_active = False
-    warm_brightness = 0
-    natural_schedule_active = False
-    natural_brightness = 0
-    
-    # Check each schedule
-    for schedule in current_schedules:
-        try:
-            # Convert schedule times to minutes
-            start_time = schedule.get("startTime", "")
-            end_time = schedule.get("endTime", "")
-            
-            # Skip schedules without proper time info
-            if not start_time or not end_time:
-                continue
-                
-            start_minutes = parse_time_to_minutes(start_time)
-            end_minutes = parse_time_to_minutes(end_time)
-            
-            # Determine if the schedule is active now
-            schedule_active = False
-            
-            # Handle schedules that cross midnight
-            if end_minutes < start_minutes:
-                # Schedule spans across midnight
-                if current_minutes >= start_minutes or current_minutes < end_minutes:  # Changed <= to < for end time
-                    schedule_active = True
-            else:
-                # Schedule within the same day
-                if start_minutes <= current_minutes < end_minutes:  # Changed <= to < for end time
-                    schedule_active = True
-            
-            if schedule_active:
-                print(f"Schedule active: {schedule}")
-                light_type = schedule.get("lightType", "both")
-                brightness = int(schedule.get("brightness", 100))
-                
-                if light_type == "warm" or light_type == "both":
-                    warm_schedule_active = True
-                    warm_brightness = max(warm_brightness, brightness)
-                
-                if light_type == "natural" or light_type == "both":
-                    natural_schedule_active = True
-                    natural_brightness = max(natural_brightness, brightness)
-        
-        except Exception as e:
-            print(f"Error processing schedule: {e}")
-            continue
+    # Look up the compiled segment for this minute (None = no schedule active for that LED)
+    warm_brightness, natural_brightness = levels_at(schedule_segments, current_minutes)
     
     # Apply the LED states based on active schedules or manual settings
-    if warm_schedule_active:
+    if warm_brightness is not None:
         # Schedule has priority - apply schedule settings
-        print(f"Setting warm LED to {warm_brightness}% (scheduled)")
+        log.debug("Setting warm LED to %d%% (scheduled)", warm_brightness)
         set_led_brightness(warm_led_pwm, warm_brightness, is_from_schedule=True)
     else:
         # No schedule active - apply manual setting
-        print(f"No warm schedule active, using manual setting: {last_manual_warm_brightness}%")
+        log.debug("No warm schedule active, using manual setting: %d%%", last_manual_warm_brightness)
         set_led_brightness(warm_led_pwm, last_manual_warm_brightness, is_from_schedule=True)
     
-    if natural_schedule_active:
+    if natural_brightness is not None:
         # Schedule has priority - apply schedule settings
-        print(f"Setting natural LED to {natural_brightness}% (scheduled)")
+        log.debug("Setting natural LED to %d%% (scheduled)", natural_brightness)
         set_led_brightness(natural_led_pwm, natural_brightness, is_from_schedule=True)
     else:
         # No schedule active - apply manual setting
-        print(f"No natural schedule active, using manual setting: {last_manual_natural_brightness}%")
+        log.debug("No natural schedule active, using manual setting: %d%%", last_manual_natural_brightness)
         set_led_brightness(natural_led_pwm, last_manual_natural_brightness, is_from_schedule=True)
 
+def get_schedule_timeline(schedules=None, query_string=""):
+    """Dry-run schedules over a minute range and return the level transitions.
+
+    Uses the current schedules when none are given. The range comes from the
+    ?from= and ?to= query parameters, counted in minutes from today's midnight
+    (defaults: the current minute, and one day after it).
+    """
+    if schedules is None:
+        segments = schedule_segments
+    else:
+        segments = compile_schedules(schedules)
+    
+    from_str = get_query_param(query_string, 'from')
+    to_str = get_query_param(query_string, 'to')
+    if from_str is not None:
+        range_start = int(from_str)
+    elif time_synced:
+        range_start = get_minutes_since_midnight()
+    else:
+        range_start = 0
+    range_end = int(to_str) if to_str is not None else range_start + MINUTES_PER_DAY
+    
+    if range_end <= range_start or (range_end - range_start) > MAX_TIMELINE_MINUTES:
+        raise ValueError(f"Range must be 1-{MAX_TIMELINE_MINUTES} minutes long")
+    
+    return {
+        "from": range_start,
+        "to": range_end,
+        "segments": len(segments),
+        "transitions": timeline(segments, range_start, range_end,
+                                last_manual_warm_brightness, last_manual_natural_brightness)
+    }
+
 # --- HTTP Server Setup ---
 
 def start_server(ip_address):
     """Starts the HTTP server on the specified IP address."""
     if ip_address is None:
-        print("Cannot start server without an IP address.")
+        log.error("Cannot start server without an IP address.")
         return None
 
     addr = (ip_address, 80) # Bind to the ESP32's IP and port 80
@@ -354,25 +643,207 @@ def start_server(ip_address):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Allow socket reuse
         s.bind(addr)
-        s.listen(5) # Listen for up to 5 connections
-        print(f'HTTP server listening on http://{ip_address}:80')
+        s.listen(LISTEN_BACKLOG) # Cap connections waiting while one is served
+        log.info("HTTP server listening on http://%s:80", ip_address)
         return s
     except OSError as e:
-        print(f"Failed to start socket server: {e}")
+        log.error("Failed to start socket server: %s", e)
         # Check if address is already in use
         if e.args[0] == 98: # errno 98 is Address already in use
-            print("Address already in use. Server might already be running or needs a restart.")
+            log.error("Address already in use. Server might already be running or needs a restart.")
         return None
 
+# --- Admission Control ---
+
+# Pre-encoded rejections so shedding load costs no formatting or allocation
+# 429s by Retry-After seconds; admit_client() picks the first that covers the client's debt
+RESPONSE_429_BY_DELAY = (
+    (1, b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"),
+    (5, b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 5\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"),
+    (30, b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 30\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"),
+    (60, b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 60\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+)
+RESPONSE_503 = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+RESPONSE_413 = b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+client_buckets = {}  # Client IP -> [tokens, time.ticks_ms() of last refill]
+client_wait_ms = 0  # Time the current connection spent waiting on its client (reads and blocked sends)
+global_bucket = [GLOBAL_BURST, time.ticks_ms()]
+admission_stats = {
+    "accepted": 0,      # Connections admitted and served
+    "rate_limited": 0,  # Rejected with 429 (per-client limit)
+    "overloaded": 0,    # Rejected with 503 (global limit)
+    "timed_out": 0,     # Dropped for missing the read or response deadline
+    "dropped": 0,       # Dropped on another socket error (e.g. reset by the client)
+    "too_large": 0      # Rejected with 413
+}
+
+def take_token(bucket, rate, burst, now):
+    """Refills a token bucket for the elapsed time and tries to take one token."""
+    elapsed = time.ticks_diff(now, bucket[1])
+    bucket[1] = now
+    bucket[0] = min(burst, bucket[0] + elapsed * rate / 1000)
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return True
+    return False
+
+def admit_client(client_ip):
+    """Decides whether to serve a new connection.
+    
+    Returns None to admit it, or the pre-encoded rejection to send instead.
+    """
+    now = time.ticks_ms()
+    bucket = client_buckets.get(client_ip)
+    if bucket is None:
+        if len(client_buckets) >= MAX_TRACKED_CLIENTS:
+            # Forget the client whose bucket would be fullest by now, so clients in debt stay limited
+            fullest = max(client_buckets, key=lambda ip: client_buckets[ip][0] + time.ticks_diff(now, client_buckets[ip][1]) * CLIENT_RATE / 1000)
+            del client_buckets[fullest]
+        bucket = [CLIENT_BURST, now]
+        client_buckets[client_ip] = bucket
+    
+    if not take_token(bucket, CLIENT_RATE, CLIENT_BURST, now):
+        admission_stats["rate_limited"] += 1
+        return rate_limit_response(bucket)
+    if not take_token(global_bucket, GLOBAL_RATE, GLOBAL_BURST, now):
+        admission_stats["overloaded"] += 1
+        return RESPONSE_503
+    admission_stats["accepted"] += 1
+    return None
+
+def rate_limit_response(bucket):
+    """Picks the 429 whose Retry-After covers the time until the bucket holds a token again."""
+    wait = (1 - bucket[0]) / CLIENT_RATE
+    for delay, response in RESPONSE_429_BY_DELAY:
+        if delay >= wait:
+            return response
+    return RESPONSE_429_BY_DELAY[-1][1]
+
+def charge_client(client_ip, held_ms):
+    """Charges a client for the time its connection kept the single server loop waiting on it.
+    
+    Buckets otherwise count connections only, so a client sending slowly
+    would hold the loop for the whole deadline and earn its tokens back
+    meanwhile. The debt this leaves keeps it out until it is paid off.
+    Only client_wait_ms is charged, never the server's own work (NTP, flash).
+    """
+    bucket = client_buckets.get(client_ip)
+    if bucket is not None and held_ms > CLIENT_FREE_HOLD_MS:
+        bucket[0] -= (held_ms - CLIENT_FREE_HOLD_MS) / CLIENT_HOLD_MS_PER_TOKEN
+
+def drain_and_close(client_socket):
+    """Briefly reads what the client is still sending, then closes.
+    
+    Closing with unread data makes the stack send a RST, which can destroy
+    a rejection response before the client reads it.
+    """
+    deadline = time.ticks_add(time.ticks_ms(), REJECT_DRAIN_MS)
+    try:
+        while True:
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                break
+            client_socket.settimeout(remaining / 1000)
+            if not client_socket.recv(512):
+                break # Client finished sending
+    except OSError:
+        pass # Timed out or reset; either way we're done
+    finally:
+        client_socket.close()
+
+def send_to_client(client_socket, data):
+    """sendall() that counts time blocked on a slow reader towards client_wait_ms."""
+    global client_wait_ms
+    start = time.ticks_ms()
+    try:
+        client_socket.sendall(data)
+    finally:
+        client_wait_ms += time.ticks_diff(time.ticks_ms(), start)
+
+def read_request(client_socket):
+    """Reads a complete HTTP request within READ_TIMEOUT_MS per read and CONNECTION_DEADLINE_MS overall.
+    
+    Returns the raw request bytes, or None if the client was too slow or the request too large.
+    """
+    deadline = time.ticks_add(time.ticks_ms(), CONNECTION_DEADLINE_MS)
+    data = b""
+    try:
+        while True:
+            header_end_index = data.find(b"\r\n\r\n")
+            if header_end_index != -1:
+                # Headers are in; stop once the body announced by Content-Length has arrived
+                headers = data[:header_end_index].lower()
+                length_index = headers.find(b"content-length:")
+                content_length = 0
+                if length_index != -1:
+                    line_end = headers.find(b"\r\n", length_index)
+                    try:
+                        content_length = int(headers[length_index + 15:line_end if line_end != -1 else len(headers)])
+                    except ValueError:
+                        pass # handle_request reports the invalid header
+                if len(data) >= header_end_index + 4 + content_length:
+                    return data
+            
+            if len(data) >= MAX_REQUEST_BYTES:
+                admission_stats["too_large"] += 1
+                client_socket.sendall(RESPONSE_413)
+                drain_and_close(client_socket)
+                return None
+            
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                admission_stats["timed_out"] += 1
+                return None
+            client_socket.settimeout(min(READ_TIMEOUT_MS, remaining) / 1000)
+            chunk = client_socket.recv(MAX_REQUEST_BYTES - len(data))
+            if not chunk:
+                return data # Client closed its side; handle what was sent
+            data += chunk
+    except OSError as e:
+        # Error 116 is ETIMEDOUT, as in the main loop's accept()
+        if "[Errno 116]" in str(e) or "timed out" in str(e):
+            admission_stats["timed_out"] += 1
+            log.debug("Dropped slow client: %s", e)
+        else:
+            admission_stats["dropped"] += 1
+            log.debug("Dropped client after socket error: %s", e)
+        return None
+
+def serve_connection(client_socket, client_address):
+    """Admits or sheds a new connection, then serves it."""
+    global client_wait_ms
+    client_ip = client_address[0]
+    rejection = admit_client(client_ip)
+    if rejection is None:
+        client_wait_ms = 0
+        handle_request(client_socket)
+        charge_client(client_ip, client_wait_ms)
+        return
+    
+    try:
+        client_socket.settimeout(READ_TIMEOUT_MS / 1000)
+        client_socket.sendall(rejection)
+    except OSError:
+        client_socket.close() # The client is going away anyway
+        return
+    drain_and_close(client_socket)
+
 # --- Request Handling ---
 
 def handle_request(client_socket):
     """Handles an incoming HTTP request."""
-    global current_schedules, last_manual_warm_brightness, last_manual_natural_brightness # Allow modification of the global variables
+    global current_schedules, schedule_segments, last_manual_warm_brightness, last_manual_natural_brightness, pending_wifi_config, client_wait_ms # Allow modification of the global variables
     try:
-        request_bytes = client_socket.recv(2048) # Increased buffer size for potentially larger JSON payloads
+        # Time spent receiving is charged to the client (see charge_client())
+        read_start = time.ticks_ms()
+        request_bytes = read_request(client_socket)
+        client_wait_ms += time.ticks_diff(time.ticks_ms(), read_start)
+        if request_bytes is None:
+            return
+        # Writes get the same per-operation bound as reads
+        client_socket.settimeout(READ_TIMEOUT_MS / 1000)
         request_str = request_bytes.decode('utf-8')
-        # print('Request string:', request_str) # Debug: print raw request string
 
         # Find the end of headers (double CRLF)
         header_end_index = request_str.find('\r\n\r\n')
@@ -453,7 +924,58 @@ def handle_request(client_socket):
                     response_body = "Missing 'level' parameter. Use ?level=0-100"
                     handled = True
             elif path == "/schedules": # GET endpoint to retrieve current schedules (optional)
-                response_body = ujson.dumps(current_schedules)
+                # Stream record by record so the full JSON never has to fit in RAM
+                send_json_array_streamed(client_socket, response_status, current_schedules,
+                                         chunked=(len(parts) < 3 or parts[2] != "HTTP/1.0"))
+                return
+            elif path == "/schedules/timeline": # GET endpoint to preview what the current schedules will do
+                try:
+                    response_body = ujson.dumps(get_schedule_timeline(None, query_string))
+                    content_type = "application/json"
+                except ValueError as e:
+                    response_status = "HTTP/1.1 400 Bad Request"
+                    response_body = f"Invalid timeline range: {e}"
+                handled = True
+            elif path == "/logs": # GET endpoint to read the RAM log, e.g. /logs?since=42
+                since_str = get_query_param(query_string, 'since')
+                try:
+                    since = int(since_str) if since_str is not None else 0
+                    response_body = ujson.dumps({
+                        "next": log.next_seq(),
+                        "level": log.LEVEL_NAMES[log.get_level()],
+                        "records": log.records(since)
+                    })
+                    content_type = "application/json"
+                except ValueError:
+                    response_status = "HTTP/1.1 400 Bad Request"
+                    response_body = "Invalid 'since' parameter. Use ?since=<seq>"
+                handled = True
+            elif path == "/logs/level": # GET endpoint to change logging, e.g. /logs/level?level=debug&uart=off
+                level_str = get_query_param(query_string, 'level')
+                uart_str = get_query_param(query_string, 'uart')
+                level = log.parse_level(level_str) if level_str is not None else log.get_level()
+                uart_level = log.parse_level(uart_str) if uart_str not in (None, "off") else None
+                if level is None or (uart_str not in (None, "off") and uart_level is None):
+                    response_status = "HTTP/1.1 400 Bad Request"
+                    response_body = "Invalid level. Use debug, info, warning, error (or off for uart)"
+                else:
+                    log.set_level(level)
+                    if uart_str is not None:
+                        log.set_mirror(uart_level)
+                    response_body = f"Log level set to {log.LEVEL_NAMES[level]}"
+                handled = True
+            elif path == "/boot/metrics": # GET endpoint for boot milestones (ms since power-on)
+                metrics = {"fast_boot": FAST_BOOT}
+                for name in boot_metrics:
+                    metrics[name + "_ms"] = boot_metrics[name]
+                response_body = ujson.dumps(metrics)
+                content_type = "application/json"
+                handled = True
+            elif path == "/admission/status": # GET endpoint for shed-load counters
+                status = {"tracked_clients": len(client_buckets)}
+                for name in admission_stats:
+                    status[name] = admission_stats[name]
+                response_body = ujson.dumps(status)
                 content_type = "application/json"
                 handled = True
             elif path == "/time": # GET endpoint to check current time (debugging)
@@ -462,6 +984,19 @@ def handle_request(client_socket):
                 else:
                     response_body = "Time not synchronized yet"
                 handled = True
+            elif path == "/time/status": # GET endpoint for clock correction details
+                status = {
+                    "synced": time_synced,
+                    "time": format_time(),
+                    "correction_s": clock_correction,
+                    "drift_ppm": clock_fit[3] * 1000000,
+                    "samples": len(offset_history),
+                    "sync_interval_s": time_sync_interval,
+                    "next_sync_in_s": next_time_sync - time.time()
+                }
+                response_body = ujson.dumps(status)
+                content_type = "application/json"
+                handled = True
             elif path == "/sync": # GET endpoint to force time sync
                 if sync_time():
                     response_body = f"Time synced: {format_time()}"
@@ -503,22 +1038,13 @@ def handle_request(client_socket):
                             return
                         break
                 
-                # print(f"Content-Length: {content_length}")
-                # print(f"Body part length: {len(body_part)}")
-                # print(f"Body part received: '{body_part}'")
-
                 if content_length == 0:
                     send_response(client_socket, "HTTP/1.1 400 Bad Request", "Content-Length header missing or zero for POST", "text/plain")
                     return
 
-                # Ensure the entire body is received if it wasn't in the first recv
-                # This is a simplified body reading, assumes body_part contains the full JSON
-                # For very large JSON, chunked reading would be more robust.
+                # read_request() has already waited for Content-Length bytes of body
                 json_payload_str = body_part[:content_length] # Use content_length to get the actual body
 
-                # print(f"JSON payload string: '{json_payload_str}'")
-
-
                 if not json_payload_str:
                     response_status = "HTTP/1.1 400 Bad Request"
                     response_body = "Empty JSON payload"
@@ -528,9 +1054,10 @@ def handle_request(client_socket):
                         new_schedules = ujson.loads(json_payload_str)
                         if isinstance(new_schedules, list):
                             current_schedules = new_schedules # Replace existing schedules
+                            schedule_segments = compile_schedules(current_schedules)
                             save_schedules_to_file() # Save to flash for persistence
                             response_body = "Schedules updated successfully."
-                            print(f"Received {len(current_schedules)} schedules.")
+                            log.info("Received %d schedules.", len(current_schedules))
                             
                             # Apply schedules immediately
                             check_and_apply_schedules()
@@ -542,8 +1069,38 @@ def handle_request(client_socket):
                     except ValueError as e:
                         response_status = "HTTP/1.1 400 Bad Request"
                         response_body = f"Invalid JSON format: {e}"
-                        print(f"JSON parsing error: {e}, Payload: '{json_payload_str}'")
+                        log.warning("JSON parsing error: %s", e)
                         handled = True
+            elif path == "/schedules/timeline":
+                # Dry-run a candidate schedule list without applying or saving it
+                content_length = 0
+                for line in request_lines[1:]: # Skip the first line (request line)
+                    if line.lower().startswith('content-length:'):
+                        try:
+                            content_length = int(line.split(':')[1].strip())
+                        except ValueError:
+                            send_response(client_socket, "HTTP/1.1 400 Bad Request", "Invalid Content-Length", "text/plain")
+                            return
+                        break
+                
+                if content_length == 0:
+                    send_response(client_socket, "HTTP/1.1 400 Bad Request", "Content-Length header missing or zero for POST", "text/plain")
+                    return
+
+                json_payload_str = body_part[:content_length]
+                
+                try:
+                    candidate_schedules = ujson.loads(json_payload_str)
+                    if isinstance(candidate_schedules, list):
+                        response_body = ujson.dumps(get_schedule_timeline(candidate_schedules, query_string))
+                        content_type = "application/json"
+                    else:
+                        response_status = "HTTP/1.1 400 Bad Request"
+                        response_body = "Payload must be a JSON array of schedules."
+                except ValueError as e:
+                    response_status = "HTTP/1.1 400 Bad Request"
+                    response_body = f"Invalid timeline request: {e}"
+                handled = True
             elif path == "/wifi/config":
                 content_length = 0
                 for line in request_lines[1:]: # Skip the first line (request line)
@@ -577,24 +1134,10 @@ def handle_request(client_socket):
                             response_body = "SSID cannot be empty"
                             handled = True
                         else:
-                            # Save the new WiFi configuration
-                            if save_wifi_config(ssid, password):
-                                response_body = "WiFi configuration updated. Restarting ESP32..."
-                                handled = True
-                                
-                                # Send response before restarting
-                                send_response(client_socket, response_status, response_body, content_type)
-                                client_socket.close()
-                                
-                                # Wait a moment to ensure the response is sent
-                                time.sleep(1)
-                                
-                                # Restart the ESP32 to apply new WiFi settings
-                                machine.reset()
-                            else:
-                                response_status = "HTTP/1.1 500 Internal Server Error"
-                                response_body = "Failed to save WiFi configuration"
-                                handled = True
+                            # Queue the new configuration; the main loop applies it after this response is sent
+                            pending_wifi_config = (ssid, password)
+                            response_body = f"WiFi configuration received. Applying without restart; the device may be unreachable for up to {WIFI_SWITCH_MAX_DOWNTIME} seconds..."
+                            handled = True
                     except ValueError as e:
                         response_status = "HTTP/1.1 400 Bad Request"
                         response_body = f"Invalid JSON format: {e}"
@@ -608,12 +1151,12 @@ def handle_request(client_socket):
         if not handled:
             response_status = "HTTP/1.1 404 Not Found"
             response_body = f"Endpoint not found for method {method} and path {path}."
-            print(f"Unknown path/method: {method} {path}")
+            log.debug("Unknown path/method: %s %s", method, path)
 
         send_response(client_socket, response_status, response_body, content_type)
 
     except OSError as e:
-        print(f"Error handling request: {e}")
+        log.warning("Error handling request: %s", e)
     finally:
         client_socket.close() # Always close the socket
         gc.collect() # Help manage memory
@@ -635,14 +1178,114 @@ def get_query_param(query_string, param_name):
 # --- Helper function to send HTTP response ---
 def send_response(client_socket, status, body, content_type="text/plain"):
     """Sends an HTTP response back to the client."""
-    response = f'{status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n{body}'
-    client_socket.sendall(response.encode('utf-8'))
+    # Encode the body once and send it after the headers instead of concatenating copies
+    body_bytes = body.encode('utf-8')
+    headers = f'{status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body_bytes)}\r\nConnection: close\r\n\r\n'
+    send_to_client(client_socket, headers.encode('utf-8'))
+    send_to_client(client_socket, body_bytes)
+
+# --- Helpers to stream large responses ---
+# chunk_buffer holds one complete HTTP chunk so it goes out in a single write:
+# the hex length prefix is written right-aligned in front of the data, the CRLF
+# after it, and the final chunk also carries the terminating zero-length chunk.
+CHUNK_DATA_START = len("%x\r\n" % CHUNK_BUFFER_SIZE)  # Room for the longest length prefix
+chunk_buffer = bytearray(CHUNK_DATA_START + CHUNK_BUFFER_SIZE + len(b"\r\n0\r\n\r\n"))  # Reused by every streamed response
+chunk_view = memoryview(chunk_buffer)
+
+def send_before_deadline(client_socket, data, deadline):
+    """send_to_client() that raises OSError once the response deadline has passed."""
+    remaining = time.ticks_diff(deadline, time.ticks_ms())
+    if remaining <= 0:
+        admission_stats["timed_out"] += 1
+        raise OSError("response deadline passed")
+    client_socket.settimeout(min(READ_TIMEOUT_MS, remaining) / 1000)
+    send_to_client(client_socket, data)
+
+def flush_chunk(client_socket, used, chunked, deadline, last=False):
+    """Sends the used bytes of chunk_buffer as one chunk, plus the last-chunk marker if requested."""
+    end = CHUNK_DATA_START + used
+    if not chunked:
+        if used:
+            send_before_deadline(client_socket, chunk_view[CHUNK_DATA_START:end], deadline)
+        return
+    start = CHUNK_DATA_START
+    if used:
+        prefix = ("%x\r\n" % used).encode()
+        start -= len(prefix)
+        chunk_buffer[start:CHUNK_DATA_START] = prefix
+        chunk_buffer[end:end + 2] = b"\r\n"
+        end += 2
+    if last:
+        chunk_buffer[end:end + 5] = b"0\r\n\r\n"
+        end += 5
+    if end > start:
+        send_before_deadline(client_socket, chunk_view[start:end], deadline)
+
+def buffer_write(client_socket, used, data, chunked, deadline):
+    """Appends data to chunk_buffer, flushing it whenever full. Returns the bytes now buffered."""
+    data = memoryview(data)
+    while used + len(data) > CHUNK_BUFFER_SIZE:
+        # Fill the buffer to the brim so oversized items are split into full chunks
+        space = CHUNK_BUFFER_SIZE - used
+        chunk_buffer[CHUNK_DATA_START + used:CHUNK_DATA_START + CHUNK_BUFFER_SIZE] = data[:space]
+        flush_chunk(client_socket, CHUNK_BUFFER_SIZE, chunked, deadline)
+        data = data[space:]
+        used = 0
+    chunk_buffer[CHUNK_DATA_START + used:CHUNK_DATA_START + used + len(data)] = data
+    return used + len(data)
+
+def send_json_array_streamed(client_socket, status, items, chunked=True):
+    """Sends a list as a JSON array, serialising one item at a time.
+    
+    Items are collected into the shared chunk_buffer and sent with
+    Transfer-Encoding: chunked, so peak memory depends on the largest item
+    rather than the whole list. HTTP/1.0 clients (chunked=False) get the same
+    stream delimited by closing the connection. The whole response must go out
+    within RESPONSE_DEADLINE_MS, otherwise OSError aborts it so a slow reader
+    can't hold the loop.
+    """
+    deadline = time.ticks_add(time.ticks_ms(), RESPONSE_DEADLINE_MS)
+    headers = f'{status}\r\nContent-Type: application/json\r\n'
+    if chunked:
+        headers += 'Transfer-Encoding: chunked\r\n'
+    send_before_deadline(client_socket, (headers + 'Connection: close\r\n\r\n').encode('utf-8'), deadline)
+    
+    used = buffer_write(client_socket, 0, b"[", chunked, deadline)
+    for index, item in enumerate(items):
+        if index:
+            used = buffer_write(client_socket, used, b",", chunked, deadline)
+        used = buffer_write(client_socket, used, ujson.dumps(item).encode('utf-8'), chunked, deadline)
+    used = buffer_write(client_socket, used, b"]", chunked, deadline)
+    flush_chunk(client_socket, used, chunked, deadline, last=True)
 
 def get_device_id():
     """Generate a unique device ID based on ESP32's MAC address"""
     mac = ubinascii.hexlify(network.WLAN(network.STA_IF).config('mac')).decode()
     return f"esp32-{mac}"
 
+def refresh_firebase_registration(current_time):
+    """Registers with Firebase when due, backing off after failures.
+    
+    Each attempt is a blocking HTTPS request, so failures (no internet, setup
+    AP mode) are retried after a delay that doubles up to FIREBASE_UPDATE_INTERVAL
+    instead of on every pass of the main loop.
+    """
+    global last_firebase_update, firebase_registration_due, next_firebase_attempt, firebase_retry
+    if not firebase_registration_due and (current_time - last_firebase_update) < FIREBASE_UPDATE_INTERVAL:
+        return
+    if current_time < next_firebase_attempt:
+        return
+    
+    if register_with_firebase():
+        last_firebase_update = current_time
+        firebase_registration_due = False
+        firebase_retry = FIREBASE_RETRY_INTERVAL
+        next_firebase_attempt = 0
+    else:
+        log.warning("Will retry Firebase registration in %d s.", firebase_retry)
+        next_firebase_attempt = current_time + firebase_retry
+        firebase_retry = min(FIREBASE_UPDATE_INTERVAL, firebase_retry * 2)
+
 def register_with_firebase():
     """Register this device's IP with Firebase"""
     try:
@@ -666,14 +1309,15 @@ def register_with_firebase():
         )
         
         if response.status_code == 200:
-            print(f"Successfully registered with Firebase. Response: {response.text}")
+            log.info("Successfully registered with Firebase.")
+            record_boot_metric("registered")
             return True
         else:
-            print(f"Failed to register. Status: {response.status_code}, Response: {response.text}")
+            log.warning("Failed to register. Status: %d", response.status_code)
             return False
             
     except Exception as e:
-        print(f"Error registering device: {e}")
+        log.warning("Error registering device: %s", e)
         return False
 
 def load_wifi_config():
@@ -684,14 +1328,14 @@ def load_wifi_config():
             config = ujson.load(f)
             WIFI_SSID = config.get("ssid", "")
             WIFI_PASSWORD = config.get("password", "")
-            print(f"Loaded WiFi credentials for SSID: {WIFI_SSID}")
+            log.info("Loaded WiFi credentials for SSID: %s", WIFI_SSID)
             return True
     except OSError as e:
         # File might not exist yet, which is fine
         if "ENOENT" in str(e):
-            print(f"No WiFi config file found at {WIFI_CONFIG_FILE}. Using defaults.")
+            log.info("No WiFi config file found at %s. Using defaults.", WIFI_CONFIG_FILE)
         else:
-            print(f"Error loading WiFi config from file: {e}")
+            log.error("Error loading WiFi config from file: %s", e)
         return False
 
 def save_wifi_config(ssid, password):
@@ -707,10 +1351,10 @@ def save_wifi_config(ssid, password):
         # Update global variables
         WIFI_SSID = ssid
         WIFI_PASSWORD = password
-        print(f"Saved WiFi credentials for SSID: {ssid}")
+        log.info("Saved WiFi credentials for SSID: %s", ssid)
         return True
     except OSError as e:
-        print(f"Error saving WiFi config to file: {e}")
+        log.error("Error saving WiFi config to file: %s", e)
         return False
 
 # --- Main execution ---
@@ -718,45 +1362,34 @@ if __name__ == "__main__":
     # Load saved WiFi credentials
     load_wifi_config()
     
+    # Try to load saved schedules (local flash only, so it doesn't delay the network)
+    load_schedules_from_file()
+    
     # Try to connect with saved credentials
     esp32_ip = connect_wifi(WIFI_SSID, WIFI_PASSWORD)
 
     # If cannot connect, start in AP mode to allow configuration
     if not esp32_ip:
-        print("Could not connect to WiFi. Starting Access Point mode...")
-        ap = network.WLAN(network.AP_IF)
-        ap.active(True)
-        
-        # Generate a unique AP name using the device ID
-        device_id = get_device_id()
-        ap_ssid = f"ESP32-Setup-{device_id[-4:]}"  # Use last 4 chars of device ID
-        ap_password = "12345678"  # Simple password for setup
-        
-        ap.config(essid=ap_ssid, password=ap_password)
-        while not ap.active():
-            time.sleep(0.1)
-        
-        print(f"Access Point started: SSID: {ap_ssid}, Password: {ap_password}")
-        print(f"AP IP address: {ap.ifconfig()[0]}")
-        
+        log.warning("Could not connect to WiFi. Starting Access Point mode...")
         # Use the AP IP address for the server
-        esp32_ip = ap.ifconfig()[0]
+        esp32_ip = start_access_point()
     
     if esp32_ip:
-        # Register device with Firebase
-        register_with_firebase()
-        last_firebase_update = time.time()  # Track the initial registration time
-        
-        # Try to load saved schedules
-        load_schedules_from_file()
-        
-        # Try to sync time with NTP server
-        sync_time()
+        if not FAST_BOOT:
+            # Register device with Firebase
+            register_with_firebase()
+            last_firebase_update = time.time()  # Track the initial registration time
+            firebase_registration_due = False
+            
+            # Try to sync time with NTP server
+            sync_time()
+        # With FAST_BOOT, registration and NTP sync run from the main loop once the server is up
         
         # Start the web server
         server_socket = start_server(esp32_ip)
         if server_socket:
-            print("Server is running. Waiting for connections...")
+            record_boot_metric("server")
+            log.info("Server is running. Waiting for connections...")
             
             # Main loop
             while True:
@@ -764,20 +1397,21 @@ if __name__ == "__main__":
                     # Check if it's time to handle scheduled tasks
                     current_time = time.time()
                     
-                    # Check if we should sync time
-                    if not time_synced or (current_time - last_time_sync) >= TIME_SYNC_INTERVAL:
-                        sync_time()
-                        last_time_sync = current_time
-                    
                     # Check if we should process schedules
                     if time_synced and (current_time - last_schedule_check) >= CHECK_SCHEDULE_INTERVAL:
                         check_and_apply_schedules()
                         last_schedule_check = current_time
                     
-                    # Check if it's time to update Firebase registration (every hour)
-                    if (current_time - last_firebase_update) >= 3600:
-                        if register_with_firebase():
-                            last_firebase_update = current_time
+                    # Apply new Wi-Fi credentials in place (queued by POST /wifi/config)
+                    if pending_wifi_config is not None:
+                        server_socket = apply_pending_wifi_config(server_socket)
+                    
+                    # Rebind if the server socket was lost while switching networks
+                    if server_socket is None:
+                        server_socket = start_server(esp32_ip)
+                        if server_socket is None:
+                            time.sleep(1)
+                            continue
                     
                     # Set socket timeout to allow periodic checks
                     server_socket.settimeout(1.0)
@@ -785,35 +1419,50 @@ if __name__ == "__main__":
                     try:
                         # Accept incoming connection (with timeout)
                         client_socket, client_address = server_socket.accept()
-                        print(f"Connection from {client_address}")
-                        # Handle the request
-                        handle_request(client_socket)
+                        log.debug("Connection from %s", client_address[0])
+                        # Admit (or shed) and handle the request
+                        serve_connection(client_socket, client_address)
+                        record_boot_metric("first_response")
                     except OSError as e:
                         # Check for timeout errors by error number or message
                         # Error 116 is ETIMEDOUT - this is expected from the timeout and should be ignored
                         if "[Errno 116]" not in str(e) and "timed out" not in str(e):
-                            print(f"Error accepting connection: {e}")
+                            log.warning("Error accepting connection: %s", e)
+                    
+                    # Persist the LED levels for the next boot
+                    save_output_state_if_changed()
+                    
+                    # Background network work runs after serving, so it never delays a waiting request
+                    current_time = time.time()
+                    
+                    # Check if we should sync time
+                    if current_time >= next_time_sync:
+                        sync_time()
+                    
+                    # Check if it's time to update Firebase registration (every hour, with retry backoff)
+                    refresh_firebase_registration(current_time)
                     
                 except KeyboardInterrupt:
-                    print("Server stopped manually.")
+                    log.warning("Server stopped manually.")
                     break # Exit loop on Ctrl+C
                 
                 except Exception as e:
-                    print(f"Unexpected error in main loop: {e}")
+                    log.error("Unexpected error in main loop: %s", e)
                     time.sleep(5)  # Wait a bit before retrying
             
             # Clean up resources
-            server_socket.close()
-            print("Server socket closed.")
+            if server_socket:
+                server_socket.close()
+            log.info("Server socket closed.")
         else:
-            print("Failed to start HTTP server.")
+            log.error("Failed to start HTTP server.")
     else:
-        print("Could not connect to Wi-Fi. Server will not start.")
+        log.error("Could not connect to Wi-Fi. Server will not start.")
 
     # Optional: Deinitialize PWM or turn off LEDs before restart/exit
     if warm_led_pwm:
         warm_led_pwm.deinit()
     if natural_led_pwm:
         natural_led_pwm.deinit()
-    print("PWM deinitialized.")
+    log.info("PWM deinitialized.")
 